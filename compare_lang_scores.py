@@ -1,13 +1,52 @@
 #!/usr/bin/env python3
 import argparse
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+JUDGE_DTYPES = {
+    "index": "string",
+    "category": "category",
+    "subtask": "category",
+    "score": "float32",
+}
+
+PANDAS_VERSION = tuple(int(x) for x in pd.__version__.split(".")[:2])
+
+# Copy-on-Write lets slices and renames share buffers until written; it is
+# opt-in on pandas 2.x and always on from 3.0.
+if (2, 0) <= PANDAS_VERSION < (3, 0):
+    pd.options.mode.copy_on_write = True
+
+
+def excel_engine() -> str | None:
+    # calamine (Rust-backed) is available as a pandas engine from pandas 2.2;
+    # otherwise fall back to pandas' default (openpyxl) reader.
+    if PANDAS_VERSION < (2, 2):
+        return None
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    return "calamine"
+
 
 def load_lang(path: Path, lang: str, keep_meta: bool) -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"Missing file: {path}")
-    df = pd.read_excel(path)
+    wanted = set(JUDGE_DTYPES) if keep_meta else {"index", "score"}
+    df = pd.read_excel(
+        path,
+        engine=excel_engine(),
+        usecols=lambda col: col in wanted,
+        dtype={col: dtype for col, dtype in JUDGE_DTYPES.items() if col in wanted},
+    )
     required = {"index", "score"}
     missing = required.difference(df.columns)
     if missing:
@@ -21,9 +60,63 @@ def load_lang(path: Path, lang: str, keep_meta: bool) -> pd.DataFrame:
             cols.append("subtask")
     cols.append("score")
 
-    df = df[cols].copy()
-    df = df.rename(columns={"score": f"score_{lang}"})
-    return df
+    return df.loc[:, cols].rename(columns={"score": f"score_{lang}"})
+
+
+if numba is not None:
+    # No fastmath: it assumes NaN-free input, and NaN marks a missing score.
+    @numba.njit(parallel=True, cache=True)
+    def _row_stats_kernel(arr):
+        n, m = arr.shape
+        score_max = np.full(n, np.nan, dtype=np.float32)
+        score_min = np.full(n, np.nan, dtype=np.float32)
+        valid = np.zeros(n, dtype=np.int64)
+        masks = np.zeros(n, dtype=np.uint64)
+        for i in numba.prange(n):
+            hi = -np.inf
+            lo = np.inf
+            count = 0
+            mask = np.uint64(0)
+            for j in range(m):
+                v = arr[i, j]
+                if np.isnan(v):
+                    mask |= np.uint64(1) << np.uint64(j)
+                else:
+                    count += 1
+                    hi = max(hi, v)
+                    lo = min(lo, v)
+            if count:
+                score_max[i] = hi
+                score_min[i] = lo
+            valid[i] = count
+            masks[i] = mask
+        return score_max, score_min, valid, masks
+
+
+def row_stats(arr: np.ndarray):
+    # Per-row (max, min, valid count, missing bitmask); bit j is set when
+    # column j is NaN. Fused single pass via numba when it is installed.
+    if numba is not None:
+        return _row_stats_kernel(arr)
+    isna = np.isnan(arr)
+    bits = np.left_shift(np.uint64(1), np.arange(arr.shape[1], dtype=np.uint64))
+    return (
+        np.fmax.reduce(arr, axis=1),
+        np.fmin.reduce(arr, axis=1),
+        arr.shape[1] - isna.sum(axis=1),
+        isna.astype(np.uint64) @ bits,
+    )
+
+
+def missing_langs_column(masks: np.ndarray, langs: list[str]) -> pd.Categorical:
+    # Each row's missing set is a bitmask, so the comma-joined label is built
+    # once per distinct mask instead of once per row.
+    uniques, codes = np.unique(masks, return_inverse=True)
+    labels = [
+        ",".join(lang for i, lang in enumerate(langs) if int(mask) >> i & 1)
+        for mask in uniques
+    ]
+    return pd.Categorical.from_codes(codes.reshape(-1), categories=labels)
 
 
 def main() -> None:
@@ -73,36 +166,55 @@ def main() -> None:
     root = Path(args.root)
     paths = {lang: root / lang / f"{lang}_judge.xlsx" for lang in langs}
 
+    # Stack every language's scores into one long frame and pivot once, rather
+    # than chaining L-1 outer merges that each rehash the growing result.
     base_df = load_lang(paths[base_lang], base_lang, keep_meta=True)
-    merged = base_df
+    frames = []
     for lang in langs:
         if lang == base_lang:
-            continue
-        df = load_lang(paths[lang], lang, keep_meta=False)
-        merged = merged.merge(df, on="index", how="outer")
+            df = base_df
+        else:
+            df = load_lang(paths[lang], lang, keep_meta=False)
+        frames.append(
+            pd.DataFrame(
+                {"index": df["index"], "lang": lang, "score": df[f"score_{lang}"]}
+            )
+        )
+    long = pd.concat(frames, ignore_index=True)
+    wide = (
+        long.pivot_table(
+            index="index", columns="lang", values="score", aggfunc="first", dropna=False
+        )
+        .reindex(columns=langs)
+        .add_prefix("score_")
+        .rename_axis(columns=None)
+        .reset_index()
+    )
+
+    meta_cols = [col for col in ("category", "subtask") if col in base_df.columns]
+    if meta_cols:
+        meta = base_df[["index", *meta_cols]].drop_duplicates("index")
+        merged = meta.merge(wide, on="index", how="right")
+    else:
+        merged = wide
 
     score_cols = [f"score_{lang}" for lang in langs if f"score_{lang}" in merged.columns]
     if len(score_cols) < 2:
         raise ValueError("Need at least two language score columns to compare.")
 
-    scores = merged[score_cols]
-    merged["valid_langs"] = scores.notna().sum(axis=1)
-    merged["score_max"] = scores.max(axis=1, skipna=True)
-    merged["score_min"] = scores.min(axis=1, skipna=True)
-    merged["score_diff"] = merged["score_max"] - merged["score_min"]
-
-    missing_langs = scores.isna().apply(
-        lambda row: ",".join(
-            [lang for lang, missing in zip(langs, row.tolist()) if missing]
-        ),
-        axis=1,
+    scores = merged[score_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+    score_max, score_min, valid_langs, masks = row_stats(scores)
+    merged["valid_langs"] = valid_langs
+    merged["score_max"] = score_max
+    merged["score_min"] = score_min
+    merged["score_diff"] = score_max - score_min
+
+    merged["missing_langs"] = missing_langs_column(
+        masks, [col.removeprefix("score_") for col in score_cols]
     )
-    merged["missing_langs"] = missing_langs
 
-    filtered = merged[
-        (merged["valid_langs"] >= 2) & (merged["score_diff"] >= args.threshold)
-    ].copy()
-    filtered = filtered.sort_values("score_diff", ascending=False)
+    mask = (merged["valid_langs"] >= 2) & (merged["score_diff"] >= args.threshold)
+    filtered = merged.loc[mask].sort_values("score_diff", ascending=False)
 
     out_cols = ["index"]
     if "category" in filtered.columns:
@@ -1,110 +1,108 @@
-#!/usr/bin/env python3
-import argparse
-import json
-from pathlib import Path
-
-
-def load_json(path: Path):
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except FileNotFoundError as exc:
-        raise SystemExit(f"Input file not found: {path}") from exc
-
-
-def build_subtask_map(source_items, key_field: str, value_field: str):
-    mapping = {}
-    missing = 0
-    for item in source_items:
-        if not isinstance(item, dict):
-            continue
-        key = item.get(key_field)
-        value = item.get(value_field)
-        if key is None or value is None:
-            missing += 1
-            continue
-        mapping[key] = value
-    return mapping, missing
-
-
-def main():
-    parser = argparse.ArgumentParser(
-        description="Fill subtask field in data_64/data_total_filled.json using datav2_total_w_subtask.json."
-    )
-    parser.add_argument(
-        "--source",
-        default="datav2_total_w_subtask.json",
-        help="Source JSON file containing subtask field.",
-    )
-    parser.add_argument(
-        "--target",
-        default="data_64/data_total_filled.json",
-        help="Target JSON file to fill subtask.",
-    )
-    parser.add_argument(
-        "--output",
-        default="data_64/data_total_filled_with_subtask.json",
-        help="Output JSON file path.",
-    )
-    parser.add_argument(
-        "--key",
-        default="index",
-        help="Field name used to match items (default: index).",
-    )
-    parser.add_argument(
-        "--field",
-        default="subtask",
-        help="Field name to copy from source and fill in target.",
-    )
-    parser.add_argument(
-        "--force",
-        action="store_true",
-        help="Overwrite output if it already exists.",
-    )
-    args = parser.parse_args()
-
-    source_path = Path(args.source)
-    target_path = Path(args.target)
-    output_path = Path(args.output)
-
-    source_data = load_json(source_path)
-    target_data = load_json(target_path)
-
-    if not isinstance(source_data, list) or not isinstance(target_data, list):
-        raise SystemExit("Source and target JSON must be lists of objects.")
-
-    subtask_map, missing_src = build_subtask_map(
-        source_data, args.key, args.field
-    )
-
-    updated = 0
-    not_found = 0
-    for item in target_data:
-        if not isinstance(item, dict):
-            continue
-        if args.field in item and item[args.field] is not None:
-            continue
-        key = item.get(args.key)
-        if key in subtask_map:
-            item[args.field] = subtask_map[key]
-            updated += 1
-        else:
-            not_found += 1
-
-    if output_path.exists() and not args.force:
-        raise SystemExit(f"Output already exists: {output_path} (use --force)")
-
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text(
-        json.dumps(target_data, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
-
-    print(
-        f"Source missing {args.field}: {missing_src}; "
-        f"updated {updated}; not found {not_found}; "
-        f"wrote {output_path}"
-    )
-
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+
+from json_items import iter_json_items, write_json_items
+
+
+def build_subtask_map(source_items, key_field: str, value_field: str):
+    # One pass over the (possibly streamed) source; only the map is kept.
+    mapping = {}
+    missing = 0
+    for item in source_items:
+        if type(item) is not dict:
+            continue
+        key = item.get(key_field)
+        value = item.get(value_field)
+        if key is None or value is None:
+            missing += 1
+        else:
+            mapping[key] = value
+    return mapping, missing
+
+
+def fill_items(target_items, subtask_map, key_field: str, field: str, counts: dict):
+    # Mapped values are never None, so a single .get() both tests and fetches.
+    subtask_map_get = subtask_map.get
+    updated = not_found = 0
+    for item in target_items:
+        if type(item) is dict and item.get(field) is None:
+            value = subtask_map_get(item.get(key_field))
+            if value is not None:
+                item[field] = value
+                updated += 1
+            else:
+                not_found += 1
+        yield item
+    counts["updated"] = updated
+    counts["not_found"] = not_found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill subtask field in data_64/data_total_filled.json using datav2_total_w_subtask.json."
+    )
+    parser.add_argument(
+        "--source",
+        default="datav2_total_w_subtask.json",
+        help="Source JSON file containing subtask field.",
+    )
+    parser.add_argument(
+        "--target",
+        default="data_64/data_total_filled.json",
+        help="Target JSON file to fill subtask.",
+    )
+    parser.add_argument(
+        "--output",
+        default="data_64/data_total_filled_with_subtask.json",
+        help="Output JSON file path.",
+    )
+    parser.add_argument(
+        "--key",
+        default="index",
+        help="Field name used to match items (default: index).",
+    )
+    parser.add_argument(
+        "--field",
+        default="subtask",
+        help="Field name to copy from source and fill in target.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite output if it already exists.",
+    )
+    args = parser.parse_args()
+
+    source_path = Path(args.source)
+    target_path = Path(args.target)
+    output_path = Path(args.output)
+
+    source_items = iter_json_items(source_path)
+    target_items = iter_json_items(target_path)
+
+    if output_path.exists() and not args.force:
+        raise SystemExit(f"Output already exists: {output_path} (use --force)")
+
+    subtask_map, missing_src = build_subtask_map(
+        source_items, args.key, args.field
+    )
+
+    counts = {"updated": 0, "not_found": 0}
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_json_items(
+        output_path,
+        fill_items(target_items, subtask_map, args.key, args.field, counts),
+    )
+    updated = counts["updated"]
+    not_found = counts["not_found"]
+
+    print(
+        f"Source missing {args.field}: {missing_src}; "
+        f"updated {updated}; not found {not_found}; "
+        f"wrote {output_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
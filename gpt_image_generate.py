@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
 import base64
-import json
+import functools
+import io
+import mimetypes
 import os
+import queue
 import random
 import threading
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import types
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
 
 try:
-    from openai import OpenAI
+    import aiofiles
+    import httpx
+    import orjson
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 except ImportError as exc:
     raise SystemExit(
-        "Missing dependency: openai. Install with: pip install openai"
+        f"Missing dependency: {exc.name}. "
+        "Install with: pip install openai orjson aiofiles"
     ) from exc
 
 
@@ -24,99 +33,142 @@ LANG_MAP = {
     "data_total_ar.json": "ar",
 }
 
-_thread_local = threading.local()
-_error_lock = threading.Lock()
+# Base64 characters decoded per write; a multiple of 4 so chunks decode alone.
+B64_CHUNK_CHARS = 1 << 20
 
 
-def get_client(api_key: str, base_url: str) -> OpenAI:
-    client = getattr(_thread_local, "client", None)
-    if client is None:
-        _thread_local.client = OpenAI(api_key=api_key, base_url=base_url)
-        client = _thread_local.client
-    return client
+class Task(NamedTuple):
+    dataset_path: Path
+    lang: str
+    index: str | None
+    category: str | None
+    instruction: str | None
+    image: str | None
+
+
+_error_queue: queue.SimpleQueue = queue.SimpleQueue()
 
 
 def infer_lang(dataset_path: Path) -> str:
     name = dataset_path.name
-    if name in LANG_MAP:
-        return LANG_MAP[name]
+    lang = LANG_MAP.get(name)
+    if lang is not None:
+        return lang
     raise ValueError(f"Unsupported dataset name: {name}")
 
 
 def iter_items(dataset_path: Path, limit: int | None):
-    data = json.loads(dataset_path.read_text(encoding="utf-8"))
+    data = orjson.loads(dataset_path.read_bytes())
     if limit is not None:
         data = data[:limit]
     for item in data:
         yield item
 
 
-def save_error(error_log: Path, payload: dict):
-    with _error_lock:
-        error_log.parent.mkdir(parents=True, exist_ok=True)
-        with error_log.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+def parse_dataset(dataset_path: Path, limit: int | None) -> list[tuple]:
+    # Runs in a worker process; return only the fields Task needs to keep the
+    # pickled result small.
+    return [
+        (
+            item.get("index"),
+            item.get("category"),
+            item.get("instruction"),
+            item.get("image"),
+        )
+        for item in iter_items(dataset_path, limit)
+    ]
+
+
+@functools.lru_cache(maxsize=256)
+def _load_image_bytes(path_str: str) -> bytes:
+    return Path(path_str).read_bytes()
+
+
+async def write_b64(output_path: Path, b64: str):
+    # Decode into a temp file and rename it into place only once complete, so
+    # a failed or cancelled write never leaves a partial image that later runs
+    # would skip as already generated.
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    # Chunks must hold whole 4-char groups, so drop any line wrapping first.
+    b64 = "".join(b64.split())
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            for start in range(0, len(b64), B64_CHUNK_CHARS):
+                await f.write(base64.b64decode(b64[start : start + B64_CHUNK_CHARS]))
+        tmp_path.replace(output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def save_error(payload: dict):
+    _error_queue.put(payload)
+
+
+def error_writer(error_log: Path):
+    # Drains _error_queue until a None sentinel; the log is opened once, on
+    # the first error, so clean runs leave no empty file behind.
+    f = None
+    try:
+        while (payload := _error_queue.get()) is not None:
+            if f is None:
+                error_log.parent.mkdir(parents=True, exist_ok=True)
+                f = error_log.open("ab")
+            f.write(orjson.dumps(payload) + b"\n")
+            f.flush()
+    finally:
+        if f is not None:
+            f.close()
 
 
-def call_edit(
-    client: OpenAI,
-    image_path: Path,
+async def call_edit(
+    client: AsyncOpenAI,
+    image_name: str,
+    image_bytes: bytes,
     prompt: str,
     model: str,
     size: str | None,
 ):
+    # Same type httpx would guess from the name, but unknown extensions are
+    # sent as image/png rather than application/octet-stream.
+    content_type = mimetypes.guess_type(image_name)[0] or "image/png"
     kwargs = {
         "model": model,
         "prompt": prompt,
-        "image": image_path.open("rb"),
+        "image": (image_name, io.BytesIO(image_bytes), content_type),
         "response_format": "b64_json",
         "n": 1,
     }
     if size:
         kwargs["size"] = size
-    try:
-        if hasattr(client.images, "edit"):
-            resp = client.images.edit(**kwargs)
-        elif hasattr(client.images, "edits"):
-            resp = client.images.edits(**kwargs)
-        else:
-            raise RuntimeError("OpenAI SDK does not expose images.edit(s).")
-    finally:
-        kwargs["image"].close()
+    if hasattr(client.images, "edit"):
+        resp = await client.images.edit(**kwargs)
+    elif hasattr(client.images, "edits"):
+        resp = await client.images.edits(**kwargs)
+    else:
+        raise RuntimeError("OpenAI SDK does not expose images.edit(s).")
     if not resp.data or not getattr(resp.data[0], "b64_json", None):
         raise RuntimeError("No image data returned by API.")
     return resp.data[0].b64_json
 
 
-def process_task(
-    task: dict,
-    api_key: str,
-    base_url: str,
-    output_root: Path,
-    overwrite: bool,
-    model: str,
-    size: str | None,
-    retries: int,
-    sleep: float,
-    error_log: Path,
-):
-    dataset_path = task["dataset_path"]
+async def process_task(task: Task, cfg: types.SimpleNamespace):
+    dataset_path = task.dataset_path
     dataset_dir = dataset_path.parent
-    image_rel = task["image"]
-    instruction = task["instruction"]
-    index = task["index"]
-    category = task["category"]
-    lang = task["lang"]
+    image_rel = task.image
+    instruction = task.instruction
+    index = task.index
+    category = task.category
+    lang = task.lang
 
     input_path = dataset_dir / image_rel
-    output_path = output_root / lang / category / f"{index}.png"
+    output_path = cfg.output_root / lang / category / f"{index}.png"
 
-    if output_path.exists() and not overwrite:
+    if output_path.exists() and not cfg.overwrite:
         return "skipped", output_path
 
     if not input_path.exists():
         save_error(
-            error_log,
             {
                 "type": "missing_input",
                 "dataset": str(dataset_path),
@@ -128,7 +180,6 @@ def process_task(
 
     if not instruction:
         save_error(
-            error_log,
             {
                 "type": "missing_instruction",
                 "dataset": str(dataset_path),
@@ -139,16 +190,29 @@ def process_task(
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    for attempt in range(1, retries + 1):
+    image_bytes = None
+    for attempt in range(1, cfg.retries + 1):
         try:
-            client = get_client(api_key, base_url)
-            b64 = call_edit(client, input_path, instruction, model, size)
-            output_path.write_bytes(base64.b64decode(b64))
+            async with cfg.semaphore:
+                # Read lazily under the semaphore; the LRU cache dedupes source
+                # images shared by several prompts.
+                if image_bytes is None:
+                    image_bytes = await asyncio.to_thread(
+                        _load_image_bytes, str(input_path)
+                    )
+                b64 = await call_edit(
+                    cfg.client,
+                    input_path.name,
+                    image_bytes,
+                    instruction,
+                    cfg.model,
+                    cfg.size,
+                )
+            await write_b64(output_path, b64)
             return "ok", output_path
         except Exception as exc:
-            if attempt >= retries:
+            if attempt >= cfg.retries:
                 save_error(
-                    error_log,
                     {
                         "type": "api_error",
                         "dataset": str(dataset_path),
@@ -158,9 +222,9 @@ def process_task(
                     },
                 )
                 return "failed", output_path
-            backoff = sleep * (2 ** (attempt - 1))
-            jitter = random.uniform(0, sleep)
-            time.sleep(backoff + jitter)
+            backoff = cfg.sleep * (2 ** (attempt - 1))
+            jitter = random.uniform(0, cfg.sleep)
+            await asyncio.sleep(backoff + jitter)
 
 
 def parse_args():
@@ -229,8 +293,8 @@ def parse_args():
     parser.add_argument(
         "--workers",
         type=int,
-        default=4,
-        help="Number of concurrent workers.",
+        default=64,
+        help="Max number of in-flight API requests.",
     )
     parser.add_argument(
         "--log-every",
@@ -241,77 +305,115 @@ def parse_args():
     return parser.parse_args()
 
 
-def main():
-    args = parse_args()
-    api_key = os.environ.get(args.api_key_env)
-    if not api_key:
-        raise SystemExit(f"{args.api_key_env} is not set in the environment.")
-
-    output_root = Path(args.output_root)
-    error_log = output_root / "errors.jsonl"
-
-    tasks = []
+def load_datasets(args):
+    datasets = []
     for ds in args.datasets:
         ds_path = Path(ds)
         if not ds_path.exists():
             raise SystemExit(f"Dataset not found: {ds_path}")
-        lang = infer_lang(ds_path)
-        for item in iter_items(ds_path, args.limit):
-            tasks.append(
-                {
-                    "dataset_path": ds_path,
-                    "lang": lang,
-                    "index": item.get("index"),
-                    "category": item.get("category"),
-                    "instruction": item.get("instruction"),
-                    "image": item.get("image"),
-                }
+        datasets.append((ds_path, infer_lang(ds_path)))
+
+    # Called before any thread is started, so the pool forks a
+    # single-threaded process.
+    with ProcessPoolExecutor(max_workers=min(len(datasets), 4)) as pool:
+        parsed = list(
+            pool.map(
+                parse_dataset,
+                [ds_path for ds_path, _ in datasets],
+                [args.limit] * len(datasets),
             )
+        )
+    return datasets, parsed
 
-    if args.workers < 1:
-        raise SystemExit("--workers must be >= 1")
 
-    total = len(tasks)
+async def run(args, api_key: str, datasets, parsed):
+    ok = skipped = failed = 0
+    completed = 0
+
+    total = sum(len(items) for items in parsed)
     if total == 0:
         print("No tasks found.")
         return
 
-    ok = skipped = failed = 0
-    completed = 0
-
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = [
-            executor.submit(
-                process_task,
-                task,
-                api_key,
-                args.base_url,
-                output_root,
-                args.overwrite,
-                args.model,
-                args.size,
-                args.retries,
-                args.sleep,
-                error_log,
+    tasks = (
+        Task(ds_path, lang, *fields)
+        for (ds_path, lang), items in zip(datasets, parsed)
+        for fields in items
+    )
+    # Keep at most 2x the request limit scheduled so pending coroutines stay
+    # O(workers) rather than O(tasks).
+    max_inflight = args.workers * 2
+    inflight = set()
+
+    # One client for all requests; its pool keeps a warm connection for every
+    # request slot so TLS setup is paid once per connection, not per call.
+    client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=args.base_url,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=args.workers,
+                max_keepalive_connections=args.workers,
             )
-            for task in tasks
-        ]
-        for future in as_completed(futures):
-            status, _ = future.result()
-            completed += 1
-            if status == "ok":
-                ok += 1
-            elif status == "skipped":
-                skipped += 1
-            else:
-                failed += 1
-            if completed % args.log_every == 0 or completed == total:
-                print(
-                    f"Progress {completed}/{total} | ok={ok} skipped={skipped} failed={failed}"
-                )
+        ),
+    )
+    cfg = types.SimpleNamespace(
+        client=client,
+        semaphore=asyncio.Semaphore(args.workers),
+        output_root=Path(args.output_root),
+        overwrite=args.overwrite,
+        model=args.model,
+        size=args.size,
+        retries=args.retries,
+        sleep=args.sleep,
+    )
+    async with client:
+        while True:
+            while len(inflight) < max_inflight:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                inflight.add(asyncio.create_task(process_task(task, cfg)))
+            if not inflight:
+                break
+            done, inflight = await asyncio.wait(
+                inflight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for fut in done:
+                status, _ = fut.result()
+                completed += 1
+                if status == "ok":
+                    ok += 1
+                elif status == "skipped":
+                    skipped += 1
+                else:
+                    failed += 1
+                if completed % args.log_every == 0 or completed == total:
+                    print(
+                        f"Progress {completed}/{total} | ok={ok} skipped={skipped} failed={failed}"
+                    )
 
     print(f"Done. ok={ok} skipped={skipped} failed={failed}")
 
 
+def main():
+    args = parse_args()
+    api_key = os.environ.get(args.api_key_env)
+    if not api_key:
+        raise SystemExit(f"{args.api_key_env} is not set in the environment.")
+    if args.workers < 1:
+        raise SystemExit("--workers must be >= 1")
+
+    datasets, parsed = load_datasets(args)
+    error_log = Path(args.output_root) / "errors.jsonl"
+    writer = threading.Thread(target=error_writer, args=(error_log,), daemon=True)
+    writer.start()
+    try:
+        asyncio.run(run(args, api_key, datasets, parsed))
+    finally:
+        _error_queue.put(None)
+        writer.join()
+
+
 if __name__ == "__main__":
     main()
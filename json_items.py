@@ -0,0 +1,73 @@
+"""Read and write JSON arrays one element at a time.
+
+Shared by fill_reasoning_img.py and fill_subtask.py. ijson (streaming reads)
+and orjson (fast writes) are optional; without them the whole file is parsed
+with the stdlib and items are encoded with json.dumps.
+"""
+import json
+from pathlib import Path
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def iter_json_items(path: Path):
+    """Open a JSON array file and return an iterator over its elements."""
+    try:
+        f = path.open("rb")
+    except FileNotFoundError as exc:
+        raise SystemExit(f"Input file not found: {path}") from exc
+    if ijson is None:
+        with f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        if not isinstance(data, list):
+            raise SystemExit(f"Input JSON must be a list of objects: {path}")
+        return iter(data)
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    if first != b"[":
+        f.close()
+        raise SystemExit(f"Input JSON must be a list of objects: {path}")
+    f.seek(0)
+    return _stream_items(f)
+
+
+def _stream_items(f):
+    with f:
+        yield from ijson.items(f, "item", use_float=True)
+
+
+def _dump_item(item) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(item, option=orjson.OPT_INDENT_2)
+    return json.dumps(item, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_json_items(path: Path, items) -> None:
+    """Write items as a JSON array (indent=2), one element at a time.
+
+    Output goes to a temporary file first so reading and writing the same
+    path is safe and a failed run leaves no partial output behind.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            empty = True
+            for item in items:
+                f.write(b"[\n  " if empty else b",\n  ")
+                f.write(_dump_item(item).replace(b"\n", b"\n  "))
+                empty = False
+            f.write(b"[]" if empty else b"\n]")
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
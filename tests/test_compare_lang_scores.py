@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import compare_lang_scores as cls
+
+
+SCORES = np.array(
+    [
+        [1.0, 3.0, 2.0],
+        [np.nan, 4.0, 0.0],
+        [np.nan, np.nan, np.nan],
+        [5.0, np.nan, np.nan],
+    ],
+    dtype=np.float32,
+)
+
+
+class RowStatsTest(unittest.TestCase):
+    def _check(self, stats):
+        score_max, score_min, valid, masks = stats
+        np.testing.assert_array_equal(score_max, [3.0, 4.0, np.nan, 5.0])
+        np.testing.assert_array_equal(score_min, [1.0, 0.0, np.nan, 5.0])
+        np.testing.assert_array_equal(valid, [3, 2, 0, 1])
+        np.testing.assert_array_equal(masks, [0b000, 0b001, 0b111, 0b110])
+
+    def test_numpy_fallback(self):
+        with mock.patch.object(cls, "numba", None):
+            self._check(cls.row_stats(SCORES))
+
+    @unittest.skipIf(cls.numba is None, "numba not installed")
+    def test_numba_kernel_matches_fallback(self):
+        self._check(cls.row_stats(SCORES))
+
+
+class MissingLangsColumnTest(unittest.TestCase):
+    def test_labels_follow_mask_bits(self):
+        masks = np.array([0b000, 0b001, 0b111, 0b110, 0b001], dtype=np.uint64)
+        column = cls.missing_langs_column(masks, ["en", "zh", "es"])
+        self.assertEqual(list(column), ["", "en", "en,zh,es", "zh,es", "en"])
+
+
+if __name__ == "__main__":
+    unittest.main()
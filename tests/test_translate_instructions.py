@@ -1,3 +1,4 @@
+import asyncio
 import json
 import tempfile
 import unittest
@@ -29,82 +30,459 @@ class TranslateInstructionsLangSupportTest(unittest.TestCase):
         self.assertEqual(ti.DEFAULT_LANGS["es"], "Spanish")
 
 
-class TranslateResumeTest(unittest.TestCase):
-    def _write_source(self, path: Path):
-        data = [
-            {
-                "index": f"sample_{i}",
-                "category": "temporal_reasoning",
-                "instruction": f"instruction {i}",
-                "image": f"img_{i}.png",
-                "reference": "ref",
-                "subtask": "Life Progression",
-            }
-            for i in range(5)
+def _response(status, content=None, headers=None, finish_reason="stop"):
+    resp = mock.Mock()
+    resp.status_code = status
+    resp.headers = headers or {}
+    choice = {"message": {"content": content}, "finish_reason": finish_reason}
+    resp.content = json.dumps({"choices": [choice]}).encode()
+    if status >= 400:
+        resp.raise_for_status.side_effect = ti.httpx.HTTPStatusError(
+            str(status), request=mock.Mock(), response=resp
+        )
+    return resp
+
+
+class CallApiBatchRetryTest(unittest.TestCase):
+    def test_retry_after_header_overrides_backoff(self):
+        responses = [
+            _response(429, headers={"Retry-After": "7"}),
+            _response(200, content=json.dumps(["hola"])),
         ]
+        client = mock.Mock()
+        client.post = mock.AsyncMock(side_effect=responses)
+        with mock.patch.object(ti, "_get_client", return_value=client), mock.patch.object(
+            ti.asyncio, "sleep"
+        ) as sleep:
+            result = asyncio.run(
+                ti.call_api_batch(["hello"], "Spanish", "m", "https://x/v1", "k")
+            )
+        self.assertEqual(result, ["hola"])
+        sleep.assert_called_once_with(7.0)
+
+    def test_permanent_client_error_is_not_retried(self):
+        client = mock.Mock()
+        client.post = mock.AsyncMock(return_value=_response(400))
+        with mock.patch.object(ti, "_get_client", return_value=client), mock.patch.object(
+            ti.asyncio, "sleep"
+        ) as sleep:
+            with self.assertRaises(ti.httpx.HTTPStatusError):
+                asyncio.run(
+                    ti.call_api_batch(["hello"], "Spanish", "m", "https://x/v1", "k")
+                )
+        self.assertEqual(client.post.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_non_string_translation_is_rejected(self):
+        client = mock.Mock()
+        client.post = mock.AsyncMock(
+            return_value=_response(200, content=json.dumps(["hola", None]))
+        )
+        with mock.patch.object(ti, "_get_client", return_value=client):
+            with self.assertRaises(ti.BatchTooLargeError):
+                asyncio.run(
+                    ti.call_api_batch(["hello", "bye"], "Spanish", "m", "https://x/v1", "k")
+                )
+            client.post.return_value = _response(
+                200, content=json.dumps({"es": ["hola"], "zh": [3]})
+            )
+            with self.assertRaises(ti.BatchTooLargeError):
+                asyncio.run(
+                    ti.call_api_multilang_batch(["hello"], ["es", "zh"], "m", "https://x/v1", "k")
+                )
+
+    def test_truncated_or_malformed_reply_is_too_large(self):
+        replies = [
+            _response(200, content='["hola"]', finish_reason="length"),
+            _response(200, content='{"zh": ["x"], "ko": ["y'),
+        ]
+        client = mock.Mock()
+        client.post = mock.AsyncMock(side_effect=replies)
+        with mock.patch.object(ti, "_get_client", return_value=client):
+            for _ in replies:
+                with self.assertRaises(ti.BatchTooLargeError):
+                    asyncio.run(
+                        ti.call_api_multilang_batch(
+                            ["hello"], ["zh", "ko"], "m", "https://x/v1", "k"
+                        )
+                    )
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_waits_for_refill_once_bucket_is_empty(self):
+        clock = {"now": 100.0}
+
+        async def fake_sleep(seconds):
+            clock["now"] += seconds
+
+        async def drain(limiter, n):
+            for _ in range(n):
+                await limiter.acquire()
+
+        with mock.patch.object(ti.time, "monotonic", side_effect=lambda: clock["now"]), mock.patch.object(
+            ti.asyncio, "sleep", side_effect=fake_sleep
+        ) as sleep:
+            limiter = ti.RateLimiter(rpm=60)
+            asyncio.run(drain(limiter, 60))
+            sleep.assert_not_called()
+            asyncio.run(drain(limiter, 1))
+        sleep.assert_called_once()
+        self.assertAlmostEqual(sleep.call_args[0][0], 1.0)
+
+    def test_token_estimate_counts_reply_per_language(self):
+        limiter = ti.RateLimiter(tpm=100000)
+        reply = _response(200, content=json.dumps({"zh": ["x"], "ko": ["y"], "ar": ["z"]}))
+        client = mock.Mock()
+        client.post = mock.AsyncMock(return_value=reply)
+        with mock.patch.object(ti, "_get_client", return_value=client), mock.patch.object(
+            ti, "_rate_limiter", limiter
+        ), mock.patch.object(limiter, "acquire", mock.AsyncMock()) as acquire:
+            asyncio.run(
+                ti.call_api_multilang_batch(
+                    ["a" * 400], ["zh", "ko", "ar"], "m", "https://x/v1", "k"
+                )
+            )
+        # 100 prompt tokens plus 100 reply tokens for each of three languages.
+        acquire.assert_called_once_with(tokens=400 + 200)
+
+
+class ProgressEncodingTest(unittest.TestCase):
+    def _round_trip(self):
+        payload = {"done_indices": [0, 2], "cache": {"a": "b"}, "items": ["b", None, "b"]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "progress.json"
+            ti._atomic_write_progress(path, payload)
+            return path.read_bytes(), ti._load_progress_state(path), payload
+
+    def test_json_fallback_round_trips(self):
+        with mock.patch.object(ti, "zstandard", None):
+            raw, loaded, payload = self._round_trip()
+        self.assertEqual(json.loads(raw), payload)
+        self.assertEqual(loaded, payload)
+
+    @unittest.skipIf(ti.zstandard is None, "zstandard/msgpack not installed")
+    def test_compressed_snapshot_round_trips(self):
+        raw, loaded, payload = self._round_trip()
+        self.assertTrue(raw.startswith(ti._ZSTD_MAGIC))
+        self.assertEqual(loaded, payload)
+
+
+class ValidateProgressStateTest(unittest.TestCase):
+    def _validate(self, done_indices, items):
+        state = {
+            "version": ti.PROGRESS_VERSION,
+            "source_path": "/src.json",
+            "source_size": len(items),
+            "model": "m",
+            "base_url": "u",
+            "lang_code": "zh",
+            "done_indices": done_indices,
+            "cache": {},
+            "items": items,
+        }
+        return ti._validate_progress_state(
+            state, "/src.json", len(items), "m", "u", "zh", Path("p.json")
+        )
+
+    def test_done_flags_are_built_from_indices(self):
+        done, _, items = self._validate([0, 2], ["a", None, "c"])
+        self.assertEqual(done, bytearray([1, 0, 1]))
+        self.assertEqual(items, ["a", None, "c"])
+
+    def test_invalid_indices_are_rejected(self):
+        for done_indices, message in (
+            ([3], "out of range"),
+            ([-1], "out of range"),
+            ([1], "index 1 marked done"),
+            (["x"], "must hold integers"),
+        ):
+            with self.subTest(done_indices=done_indices):
+                with self.assertRaisesRegex(RuntimeError, message):
+                    self._validate(done_indices, ["a", None, "c"])
+
+
+def _ok_call(instructions, lang_name, **kwargs):
+    return [f"{lang_name}:{x}" for x in instructions]
+
+
+def _recording_call(sent):
+    def call(instructions, lang_name, **kwargs):
+        sent.append(list(instructions))
+        return _ok_call(instructions, lang_name)
+
+    return call
+
+
+class TranslateResumeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp_path = Path(tmp.name)
+        self.src_path = self.tmp_path / "source.json"
+        self.out_dir = self.tmp_path / "out"
+
+    def _write_source(self, path=None, instructions=None):
+        if instructions is None:
+            data = [
+                {
+                    "index": f"sample_{i}",
+                    "category": "temporal_reasoning",
+                    "instruction": f"instruction {i}",
+                    "image": f"img_{i}.png",
+                    "reference": "ref",
+                    "subtask": "Life Progression",
+                }
+                for i in range(5)
+            ]
+        else:
+            data = [
+                {"index": f"sample_{i}", "instruction": s}
+                for i, s in enumerate(instructions)
+            ]
+        path = path or self.src_path
         path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
         return data
 
+    def _translate(self, call=_ok_call, target="call_api_batch", **kwargs):
+        options = dict(
+            data_path=str(self.src_path),
+            out_dir=str(self.out_dir),
+            model="m",
+            base_url="https://example.com/v1",
+            api_key="k",
+            batch_size=2,
+        )
+        options.update(kwargs)
+        with mock.patch.object(ti, target, side_effect=call) as patched:
+            ti.translate_dataset(**options)
+        return patched
+
+    def _output(self, name):
+        return json.loads((self.out_dir / f"{name}.json").read_text(encoding="utf-8"))
+
+    def _output_instructions(self, name):
+        return [item["instruction"] for item in self._output(name)]
+
     def test_resume_after_partial_failure(self):
-        with tempfile.TemporaryDirectory() as tmp:
-            tmp_path = Path(tmp)
-            src_path = tmp_path / "source.json"
-            out_dir = tmp_path / "out"
-            source_data = self._write_source(src_path)
-
-            attempts = {"count": 0}
-
-            def flaky_call(instructions, lang_name, model, base_url, api_key, timeout, max_retries):
-                attempts["count"] += 1
-                if attempts["count"] == 2:
-                    raise RuntimeError("simulated timeout")
-                return [f"{lang_name}:{x}" for x in instructions]
-
-            with mock.patch.object(ti, "call_api_batch", side_effect=flaky_call):
-                with self.assertRaises(RuntimeError):
-                    ti.translate_dataset(
-                        data_path=str(src_path),
-                        out_dir=str(out_dir),
-                        langs=["ru"],
-                        model="m",
-                        base_url="https://example.com/v1",
-                        api_key="k",
-                        batch_size=2,
-                        timeout=1,
-                        max_retries=1,
-                        resume=True,
-                        force_restart=False,
-                    )
+        source_data = self._write_source()
+        attempts = {"count": 0}
 
-            progress_path = out_dir / ".translate_progress_source_ru.json"
-            self.assertTrue(progress_path.exists())
-            state = json.loads(progress_path.read_text(encoding="utf-8"))
-            self.assertEqual(len(state["done_indices"]), 2)
-
-            def ok_call(instructions, lang_name, model, base_url, api_key, timeout, max_retries):
-                return [f"{lang_name}:{x}" for x in instructions]
-
-            with mock.patch.object(ti, "call_api_batch", side_effect=ok_call):
-                ti.translate_dataset(
-                    data_path=str(src_path),
-                    out_dir=str(out_dir),
-                    langs=["ru"],
-                    model="m",
-                    base_url="https://example.com/v1",
-                    api_key="k",
-                    batch_size=2,
-                    timeout=1,
-                    max_retries=1,
-                    resume=True,
-                    force_restart=False,
-                )
+        def flaky_call(instructions, lang_name, **kwargs):
+            attempts["count"] += 1
+            if attempts["count"] == 2:
+                raise RuntimeError("simulated timeout")
+            return _ok_call(instructions, lang_name)
+
+        with self.assertRaises(RuntimeError):
+            self._translate(flaky_call, langs=["ru"], max_retries=1)
+
+        progress_path = ti._progress_path(self.out_dir, "source", "ru")
+        self.assertTrue(progress_path.exists())
+        state = ti._load_progress_state(progress_path)
+        self.assertEqual(len(state["done_indices"]), 2)
+
+        self._translate(langs=["ru"], max_retries=1)
+
+        self.assertFalse(progress_path.exists())
+        out_data = self._output("source_ru")
+        self.assertEqual(len(out_data), len(source_data))
+        self.assertTrue(all(item["instruction"].startswith("Russian:") for item in out_data))
+
+    def test_resume_replays_progress_log(self):
+        self._write_source()
+        with self.assertRaises(RuntimeError):
+            self._translate(RuntimeError("simulated timeout"), langs=["ru"], max_retries=1)
+
+        # Simulate a crash after a batch was logged but before compaction.
+        log_path = self.out_dir / ".translate_progress_source_ru.jsonl"
+        with log_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"s": "instruction 0", "t": "from log"}) + "\n")
+            f.write('{"s": "instruction 1", "t"')
+        sent = []
+        self._translate(_recording_call(sent), langs=["ru"], max_retries=1)
+
+        sent = [s for batch in sent for s in batch]
+        self.assertNotIn("instruction 0", sent)
+        self.assertIn("instruction 1", sent)
+        self.assertFalse(log_path.exists())
+        self.assertEqual(self._output_instructions("source_ru")[0], "from log")
+
+    def test_concurrent_batches_keep_item_order(self):
+        source_data = self._write_source()
+        self._translate(langs=["ja"], concurrency=3)
+
+        out_data = self._output("source_ja")
+        self.assertEqual(
+            [item["instruction"] for item in out_data],
+            [f"Japanese:{item['instruction']}" for item in source_data],
+        )
+        self.assertEqual(
+            [item["index"] for item in out_data],
+            [item["index"] for item in source_data],
+        )
+
+    def test_all_languages_share_one_request_per_batch(self):
+        source_data = self._write_source()
+
+        def multi_call(instructions, lang_codes, **kwargs):
+            return {code: [f"{code}:{x}" for x in instructions] for code in lang_codes}
+
+        call = self._translate(
+            multi_call, target="call_api_multilang_batch", langs=["zh", "ko"]
+        )
+
+        self.assertEqual(call.call_count, 3)
+        for code in ("zh", "ko"):
+            self.assertEqual(
+                self._output_instructions(f"source_{code}"),
+                [f"{code}:{item['instruction']}" for item in source_data],
+            )
+
+    def test_duplicate_instructions_are_translated_once(self):
+        self._write_source(instructions=[f"instruction {i % 2}" for i in range(6)])
+        sent = []
+        self._translate(_recording_call(sent), langs=["fi"], batch_size=10)
+
+        self.assertEqual(sent, [["instruction 0", "instruction 1"]])
+        self.assertEqual(
+            self._output_instructions("source_fi"),
+            [f"Finnish:instruction {i % 2}" for i in range(6)],
+        )
+
+    def test_oversized_batch_is_split_and_retried(self):
+        source_data = self._write_source()
+        sizes = []
+
+        def picky_call(instructions, lang_codes, **kwargs):
+            sizes.append(len(instructions))
+            if len(instructions) > 2:
+                raise ti.BatchTooLargeError("length mismatch")
+            return {code: [f"{code}:{x}" for x in instructions] for code in lang_codes}
+
+        self._translate(
+            picky_call, target="call_api_multilang_batch", langs=["he"], batch_size=4
+        )
+
+        self.assertEqual(sizes[0], 4)
+        self.assertEqual(
+            self._output_instructions("source_he"),
+            [f"he:{item['instruction']}" for item in source_data],
+        )
+
+    def test_char_budget_scales_with_requested_languages(self):
+        self._write_source()
+        sizes = []
+
+        def multi_call(instructions, lang_codes, **kwargs):
+            sizes.append(len(instructions))
+            return {code: [f"{code}:{x}" for x in instructions] for code in lang_codes}
+
+        # 13-char instructions: 4 fit in 60 chars, but only 2 once doubled
+        # for two languages.
+        self._translate(
+            multi_call,
+            target="call_api_multilang_batch",
+            langs=["zh", "ko"],
+            batch_size=4,
+            max_batch_chars=60,
+        )
+        self.assertEqual(sizes, [2, 2, 1])
+
+    def test_shared_cache_is_reused_across_datasets(self):
+        second_path = self.tmp_path / "second.json"
+        source_data = self._write_source()
+        self._write_source(second_path)
+        sent = []
+        call = _recording_call(sent)
+
+        self._translate(call, langs=["sw"])
+        self.assertEqual(sum(map(len, sent)), len(source_data))
+        self._translate(call, data_path=str(second_path), langs=["sw"])
+        self._translate(call, data_path=str(second_path), langs=["sw"], model="other")
+
+        # The second dataset is served from the cache; a new model is not.
+        self.assertEqual(sum(map(len, sent)), 2 * len(source_data))
+        self.assertTrue((self.out_dir / ti.TRANSLATION_CACHE_NAME).exists())
+        self.assertEqual(
+            self._output_instructions("second_sw"),
+            [f"Swahili:{item['instruction']}" for item in source_data],
+        )
+
+    def test_small_remainder_is_spread_over_idle_slots(self):
+        self._write_source(instructions=[f"instruction {i}" for i in range(12)])
+        sent = []
+        self._translate(_recording_call(sent), langs=["bn"], batch_size=10, concurrency=4)
+
+        self.assertEqual([len(batch) for batch in sent], [4, 4, 4])
+        self.assertEqual(
+            self._output_instructions("source_bn"),
+            [f"Bengali:instruction {i}" for i in range(12)],
+        )
+
+    def test_untranslatable_instructions_skip_the_api(self):
+        instructions = ["", "  ", "42", "(1) -> (2)?", "rotate it"]
+        self._write_source(instructions=instructions)
+        sent = []
+        self._translate(_recording_call(sent), langs=["yo"], batch_size=10)
+
+        self.assertEqual(sent, [["rotate it"]])
+        self.assertEqual(
+            self._output_instructions("source_yo"),
+            instructions[:-1] + ["Yoruba:rotate it"],
+        )
+
+    def test_null_instruction_is_written_as_empty(self):
+        self._write_source(instructions=[None, "rotate it"])
+        sent = []
+        self._translate(_recording_call(sent), langs=["ko"])
+
+        self.assertEqual(sent, [["rotate it"]])
+        self.assertEqual(self._output_instructions("source_ko"), ["", "Korean:rotate it"])
+
+    def test_resume_accepts_snapshot_with_full_items(self):
+        source_data = self._write_source()
+        self.out_dir.mkdir()
+        items = [None] * len(source_data)
+        items[0] = dict(source_data[0], instruction="old snapshot")
+        state = {
+            "version": ti.PROGRESS_VERSION,
+            "source_path": str(self.src_path.resolve()),
+            "source_size": len(source_data),
+            "model": "m",
+            "base_url": "https://example.com/v1",
+            "lang_code": "ru",
+            "done_indices": [0],
+            "cache": {"instruction 0": "old snapshot"},
+            "items": items,
+        }
+        (self.out_dir / ".translate_progress_source_ru.json").write_text(
+            json.dumps(state), encoding="utf-8"
+        )
+
+        self._translate(langs=["ru"], shared_cache=False)
+
+        self.assertFalse(any(self.out_dir.glob(".translate_progress_*")))
+        out_data = self._output("source_ru")
+        self.assertEqual(out_data[0], dict(source_data[0], instruction="old snapshot"))
+        self.assertEqual(out_data[1]["instruction"], "Russian:instruction 1")
+
+    def test_force_restart_bypasses_shared_cache(self):
+        source_data = self._write_source()
+
+        def bad_call(instructions, lang_name, **kwargs):
+            return [f"BAD:{x}" for x in instructions]
+
+        self._translate(bad_call, langs=["ru"], batch_size=10)
+        call = self._translate(langs=["ru"], batch_size=10, force_restart=True)
+        self.assertEqual(call.call_count, 1)
+        # The forced run refreshed the cache, so this run reuses it.
+        call = self._translate(bad_call, langs=["ru"], batch_size=10)
+        call.assert_not_called()
 
-            output_path = out_dir / "source_ru.json"
-            self.assertTrue(output_path.exists())
-            self.assertFalse(progress_path.exists())
-            out_data = json.loads(output_path.read_text(encoding="utf-8"))
-            self.assertEqual(len(out_data), len(source_data))
-            self.assertTrue(all(item["instruction"].startswith("Russian:") for item in out_data))
+        self.assertEqual(
+            self._output_instructions("source_ru"),
+            [f"Russian:{item['instruction']}" for item in source_data],
+        )
 
 
 if __name__ == "__main__":
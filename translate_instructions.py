@@ -13,12 +13,34 @@ Additional when requested via --langs:
 """
 
 import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
 import os
+import random
+import re
+import sqlite3
 import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from itertools import compress
 from pathlib import Path
 
-import requests
+import httpx
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:
+    msgpack = zstandard = None
 
 
 DEFAULT_LANGS = {
@@ -47,110 +69,459 @@ SYSTEM_TEMPLATE = (
     "with the same length and order."
 )
 
+MULTI_SYSTEM_TEMPLATE = (
+    "You are a professional translator. Translate each instruction into each of "
+    "these languages: {langs}. "
+    "Preserve meaning and sentence structure as much as possible. "
+    "Keep punctuation, quotes, and parentheses unchanged. "
+    "Keep any quoted literals or single-letter tokens (e.g., 'C', \"O\") unchanged. "
+    "Do not add or remove information. "
+    "Input is a JSON array of strings. Output only a JSON object whose keys are "
+    "{codes} and whose values are JSON arrays of strings with the same length "
+    "and order as the input."
+)
+
+_FENCE_RE = re.compile(r"\A\s*```[^\n]*\n(.*?)\n?```\s*\Z", re.S)
+# Instructions made only of whitespace, digits and punctuation translate to
+# themselves and are never sent to the API.
+_PASSTHROUGH_RE = re.compile(r"[\s\d\W]*\Z")
+
 PROGRESS_VERSION = 1
+# Completed batches between rewrites of the full progress snapshot; in between,
+# new translations are only appended to the progress log.
+PROGRESS_COMPACT_EVERY = 50
+TRANSLATION_CACHE_NAME = ".translate_cache.sqlite"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Batches answered faster than this let the next batch grow (see --max-batch-size).
+ADAPTIVE_FAST_SECONDS = 20.0
+MIN_PARALLEL_CHUNK = 4
+
+
+class BatchTooLargeError(RuntimeError):
+    """The model could not handle the batch as sent; a smaller one may work."""
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared across tasks."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self._buckets = {}
+        for name, per_minute in (("requests", rpm), ("tokens", tpm)):
+            if per_minute:
+                # [capacity, available, refill per second]
+                self._buckets[name] = [per_minute, per_minute, per_minute / 60.0]
+        self._last = time.monotonic()
+
+    async def acquire(self, tokens=0):
+        # The check-and-deduct below has no await, so it is atomic on the loop.
+        wanted = {"requests": 1, "tokens": tokens}
+        while True:
+            now = time.monotonic()
+            elapsed = now - self._last
+            self._last = now
+            wait_for = 0.0
+            for name, bucket in self._buckets.items():
+                capacity, available, rate = bucket
+                bucket[1] = min(capacity, available + elapsed * rate)
+                need = min(wanted[name], capacity)
+                if bucket[1] < need:
+                    wait_for = max(wait_for, (need - bucket[1]) / rate)
+            if wait_for == 0.0:
+                for name, bucket in self._buckets.items():
+                    bucket[1] -= min(wanted[name], bucket[0])
+                return
+            await asyncio.sleep(wait_for)
+
+
+_rate_limiter = None
+_client = None
+
+
+@contextlib.asynccontextmanager
+async def open_client(max_connections=64):
+    # One pooled client shared by every in-flight batch; HTTP/2 when the
+    # optional `h2` package is installed so batches multiplex one connection.
+    global _client
+    try:
+        import h2  # noqa: F401
+
+        http2 = True
+    except ImportError:
+        http2 = False
+    async with httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    ) as client:
+        _client = client
+        try:
+            yield client
+        finally:
+            _client = None
+
+
+def _get_client():
+    if _client is None:
+        raise RuntimeError("No HTTP client is open; wrap calls in open_client().")
+    return _client
+
+
+def configure_rate_limit(rpm=None, tpm=None):
+    global _rate_limiter
+    _rate_limiter = RateLimiter(rpm=rpm, tpm=tpm) if (rpm or tpm) else None
+    return _rate_limiter
+
+
+def _estimate_tokens(instructions, n_langs=1):
+    # Rough request-size estimate (~4 chars per token) plus fixed overhead:
+    # the prompt, and a reply carrying one translation per language.
+    text_tokens = sum(len(s) // 4 for s in instructions)
+    return text_tokens * (1 + n_langs) + 200
+
+
+def _json_dumps(obj, indent=False):
+    # UTF-8 bytes, non-ASCII kept as-is (same as ensure_ascii=False).
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def _strip_code_fence(text):
-    stripped = text.strip()
-    if stripped.startswith("```"):
-        lines = stripped.splitlines()
-        if lines and lines[0].startswith("```"):
-            lines = lines[1:]
-        if lines and lines[-1].startswith("```"):
-            lines = lines[:-1]
-        return "\n".join(lines).strip()
-    return stripped
-
-
-def call_api_batch(
-    instructions, lang_name, model, base_url, api_key, timeout=60, max_retries=6
-):
+    match = _FENCE_RE.match(text)
+    return (match.group(1) if match else text).strip()
+
+
+def _is_passthrough(instruction):
+    return _PASSTHROUGH_RE.match(instruction) is not None
+
+
+def _backoff_delay(attempt):
+    # Exponential backoff with full jitter.
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def _retry_after_seconds(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+@functools.lru_cache(maxsize=32)
+def _system_message(system_prompt):
+    return {"role": "system", "content": system_prompt}
+
+
+@functools.lru_cache(maxsize=32)
+def _single_lang_prompt(lang_name):
+    return SYSTEM_TEMPLATE.format(lang=lang_name)
+
+
+@functools.lru_cache(maxsize=32)
+def _multi_lang_prompt(lang_codes):
+    lang_names = ", ".join(f"{DEFAULT_LANGS[code]} ({code})" for code in lang_codes)
+    return MULTI_SYSTEM_TEMPLATE.format(
+        langs=lang_names, codes=json.dumps(list(lang_codes))
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _endpoint(base_url, api_key):
+    # The returned headers dict is shared between calls; treat it as read-only.
     url = base_url.rstrip("/") + "/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
+    return url, headers
+
+
+async def _chat_json(
+    system_prompt,
+    instructions,
+    model,
+    base_url,
+    api_key,
+    timeout,
+    max_retries,
+    n_langs=1,
+):
+    url, headers = _endpoint(base_url, api_key)
     payload = {
         "model": model,
         "messages": [
-            {"role": "system", "content": SYSTEM_TEMPLATE.format(lang=lang_name)},
-            {"role": "user", "content": json.dumps(instructions, ensure_ascii=False)},
+            _system_message(system_prompt),
+            {"role": "user", "content": _json_dumps(instructions).decode("utf-8")},
         ],
         "temperature": 0,
     }
+    body = _json_dumps(payload)
 
+    # Only connection errors, timeouts and RETRYABLE_STATUS responses are
+    # retried; other HTTP errors and malformed 200 responses raise at once.
+    estimated_tokens = _estimate_tokens(instructions, n_langs)
     last_err = None
     for attempt in range(1, max_retries + 1):
+        if _rate_limiter is not None:
+            await _rate_limiter.acquire(tokens=estimated_tokens)
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
-            if resp.status_code in {429, 500, 502, 503, 504}:
-                time.sleep(1.5 * attempt)
-                continue
-            resp.raise_for_status()
-            data = resp.json()
-            content = _strip_code_fence(data["choices"][0]["message"]["content"])
-            if not content:
-                raise RuntimeError("Empty translation returned by API.")
-            translations = json.loads(content)
-            if not isinstance(translations, list):
-                raise RuntimeError("API response is not a JSON array.")
-            if len(translations) != len(instructions):
-                raise RuntimeError(
-                    "API response length does not match input batch size."
-                )
-            return translations
-        except Exception as exc:
+            resp = await _get_client().post(
+                url, headers=headers, content=body, timeout=timeout
+            )
+        except httpx.TransportError as exc:
             last_err = exc
-            time.sleep(1.5 * attempt)
-    raise RuntimeError(f"API call failed after {max_retries} attempts: {last_err}")
+            delay = _backoff_delay(attempt)
+        else:
+            if resp.status_code not in RETRYABLE_STATUS:
+                break
+            last_err = RuntimeError(f"HTTP {resp.status_code} from {url}")
+            delay = _retry_after_seconds(resp)
+            if delay is None:
+                delay = _backoff_delay(attempt)
+        if attempt < max_retries:
+            await asyncio.sleep(delay)
+    else:
+        raise RuntimeError(
+            f"API call failed after {max_retries} attempts: {last_err}"
+        )
+
+    if resp.status_code == 400 and b"context_length" in resp.content:
+        raise BatchTooLargeError(f"Batch exceeds model context: {resp.text[:200]}")
+    resp.raise_for_status()
+    data = _json_loads(resp.content)
+    choice = data["choices"][0]
+    # A reply cut off at the output limit, or one that is not valid JSON, is
+    # handled like any other batch the model could not manage: split it.
+    if choice.get("finish_reason") == "length":
+        raise BatchTooLargeError("API reply was truncated at the output token limit.")
+    content = _strip_code_fence(choice["message"]["content"])
+    if not content:
+        raise RuntimeError("Empty translation returned by API.")
+    try:
+        return _json_loads(content)
+    except ValueError as exc:
+        raise BatchTooLargeError(f"API reply is not valid JSON: {exc}") from exc
+
+
+async def call_api_batch(
+    instructions, lang_name, model, base_url, api_key, timeout=60, max_retries=8
+):
+    translations = await _chat_json(
+        _single_lang_prompt(lang_name),
+        instructions,
+        model=model,
+        base_url=base_url,
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
+    if not isinstance(translations, list):
+        raise RuntimeError("API response is not a JSON array.")
+    if len(translations) != len(instructions):
+        raise BatchTooLargeError(
+            "API response length does not match input batch size."
+        )
+    if not all(isinstance(t, str) for t in translations):
+        # Treated like a garbled batch: split and retried down to one item.
+        raise BatchTooLargeError("API response contains a non-string translation.")
+    return translations
+
+
+async def call_api_multilang_batch(
+    instructions, lang_codes, model, base_url, api_key, timeout=60, max_retries=8
+):
+    """Translate `instructions` into every language in `lang_codes` at once.
+
+    Returns a dict mapping each code to its list of translations. A single
+    language goes through call_api_batch and its plain-array prompt.
+    """
+    if len(lang_codes) == 1:
+        code = lang_codes[0]
+        translations = await call_api_batch(
+            instructions,
+            DEFAULT_LANGS[code],
+            model=model,
+            base_url=base_url,
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
+        )
+        return {code: translations}
+
+    result = await _chat_json(
+        _multi_lang_prompt(tuple(lang_codes)),
+        instructions,
+        model=model,
+        base_url=base_url,
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=max_retries,
+        n_langs=len(lang_codes),
+    )
+    if not isinstance(result, dict):
+        raise RuntimeError("API response is not a JSON object.")
+    for code in lang_codes:
+        translations = result.get(code)
+        if not isinstance(translations, list):
+            raise RuntimeError(f"API response has no JSON array for {code!r}.")
+        if len(translations) != len(instructions):
+            raise BatchTooLargeError(
+                f"API response length for {code!r} does not match input batch size."
+            )
+        if not all(isinstance(t, str) for t in translations):
+            raise BatchTooLargeError(
+                f"API response for {code!r} contains a non-string translation."
+            )
+    return {code: result[code] for code in lang_codes}
 
 
 def _progress_path(out_dir_path, base_name, lang_code):
-    return out_dir_path / f".translate_progress_{base_name}_{lang_code}.json"
+    # Snapshots written as zstd-compressed msgpack are named .zst; the plain
+    # JSON fallback keeps the .json name (see _encode_progress).
+    suffix = ".zst" if zstandard is not None else ".json"
+    return out_dir_path / f".translate_progress_{base_name}_{lang_code}{suffix}"
+
+
+def _progress_snapshot_paths(progress_path):
+    # Every name a snapshot for this language may have on disk.
+    return [progress_path.with_suffix(suffix) for suffix in (".zst", ".json")]
+
+
+def _progress_log_path(progress_path):
+    return progress_path.with_suffix(".jsonl")
+
+
+def _replay_progress_log(log_path, cache):
+    if not log_path.exists():
+        return
+    with log_path.open("rb") as f:
+        for line in f:
+            try:
+                entry = _json_loads(line)
+            except ValueError:
+                # A torn final line from an interrupted append.
+                break
+            # Logs from older runs may hold a null translation; retranslate it.
+            if isinstance(entry["t"], str):
+                cache[entry["s"]] = entry["t"]
+
+
+def _cache_key(model, lang_code, instruction):
+    return hashlib.sha256(f"{model}|{lang_code}|{instruction}".encode("utf-8")).digest()
+
+
+def open_translation_cache(out_dir_path):
+    """Open the cross-run translation cache shared by every dataset in out_dir."""
+    conn = sqlite3.connect(out_dir_path / TRANSLATION_CACHE_NAME)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS t (k BLOB PRIMARY KEY, v TEXT)")
+    return conn
+
 
+def _lookup_translations(conn, model, lang_code, instructions):
+    found = {}
+    for instruction in instructions:
+        row = conn.execute(
+            "SELECT v FROM t WHERE k = ?", (_cache_key(model, lang_code, instruction),)
+        ).fetchone()
+        if row is not None:
+            found[instruction] = row[0]
+    return found
 
-def _atomic_write_json(path, payload):
+
+def _store_translations(conn, model, lang_code, instructions, translations):
+    # One transaction per API batch.
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO t (k, v) VALUES (?, ?)",
+            (
+                (_cache_key(model, lang_code, instruction), translated)
+                for instruction, translated in zip(instructions, translations)
+                if isinstance(translated, str)
+            ),
+        )
+
+
+def _encode_progress(payload):
+    # zstd-compressed msgpack when both optional packages are installed,
+    # otherwise indented JSON; the loader tells them apart by magic bytes.
+    if zstandard is not None:
+        packed = msgpack.packb(payload, use_bin_type=True)
+        return zstandard.ZstdCompressor(level=3).compress(packed)
+    return _json_dumps(payload, indent=True)
+
+
+def _atomic_write_progress(path, payload):
     tmp_path = path.with_name(path.name + ".tmp")
-    tmp_path.write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    tmp_path.write_bytes(_encode_progress(payload))
     tmp_path.replace(path)
 
 
 def _build_progress_state(
-    data_path,
+    source_path,
     total,
     model,
     base_url,
     lang_code,
-    done_indices,
+    done,
     cache,
-    out_items,
+    out_texts,
 ):
+    # `done` is a per-index 0/1 bytearray, so the indices come out in order.
     return {
         "version": PROGRESS_VERSION,
-        "source_path": str(Path(data_path).resolve()),
+        "source_path": source_path,
         "source_size": total,
         "model": model,
         "base_url": base_url,
         "lang_code": lang_code,
-        "done_indices": sorted(done_indices),
+        "done_indices": list(compress(range(len(done)), done)),
         "cache": cache,
-        "items": out_items,
+        "items": out_texts,
     }
 
 
 def _load_progress_state(progress_path):
-    return json.loads(progress_path.read_text(encoding="utf-8"))
+    raw = progress_path.read_bytes()
+    if not raw.startswith(_ZSTD_MAGIC):
+        return _json_loads(raw)
+    if zstandard is None:
+        raise RuntimeError(
+            f"Progress file {progress_path} is zstd-compressed; install "
+            "`zstandard` and `msgpack` to resume it, or use --force-restart."
+        )
+    return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(raw), raw=False)
 
 
 def _validate_progress_state(
-    state, data_path, total, model, base_url, lang_code, progress_path
+    state, source_path, total, model, base_url, lang_code, progress_path
 ):
     expected = {
         "version": PROGRESS_VERSION,
-        "source_path": str(Path(data_path).resolve()),
+        "source_path": source_path,
         "source_size": total,
         "model": model,
         "base_url": base_url,
@@ -177,24 +548,360 @@ def _validate_progress_state(
         raise RuntimeError(
             f"Progress file {progress_path} is invalid: `done_indices` must be a list."
         )
-    done_index_set = {int(i) for i in done_indices}
-    if any(i < 0 or i >= total for i in done_index_set):
+    # Snapshots written before items held bare strings store whole output
+    # items; keep just their translated instruction.
+    items = [
+        item.get("instruction") if isinstance(item, dict) else item for item in items
+    ]
+    try:
+        done_arr = np.asarray(done_indices, dtype=np.int64)
+    except (TypeError, ValueError):
+        done_arr = None
+    if done_arr is None or done_arr.ndim != 1:
+        raise RuntimeError(
+            f"Progress file {progress_path} is invalid: `done_indices` must hold integers."
+        )
+    if done_arr.size and (done_arr.min() < 0 or done_arr.max() >= total):
         raise RuntimeError(
             f"Progress file {progress_path} is invalid: `done_indices` out of range."
         )
-
-    for i in done_index_set:
-        if items[i] is None:
-            raise RuntimeError(
-                f"Progress file {progress_path} is invalid: index {i} marked done but item is null."
-            )
+    missing = np.fromiter((item is None for item in items), dtype=bool, count=total)
+    null_done = done_arr[missing[done_arr]]
+    if null_done.size:
+        raise RuntimeError(
+            f"Progress file {progress_path} is invalid: index {null_done[0]} marked done but item is null."
+        )
+    done_flags = np.zeros(total, dtype=np.uint8)
+    done_flags[done_arr] = 1
+    done = bytearray(done_flags.tobytes())
 
     cache = state.get("cache")
     if not isinstance(cache, dict):
         raise RuntimeError(
             f"Progress file {progress_path} is invalid: `cache` must be an object."
         )
-    return done_index_set, cache, items
+    # Drop null translations cached by older runs so they are requested again.
+    cache = {s: t for s, t in cache.items() if isinstance(t, str)}
+    return done, cache, items
+
+
+def _apply_cached(instructions, positions_by_instruction, state):
+    cache = state["cache"]
+    out_texts = state["out_texts"]
+    done = state["done"]
+    for instruction in instructions:
+        translated = cache[instruction]
+        for idx in positions_by_instruction[instruction]:
+            if done[idx]:
+                continue
+            out_texts[idx] = translated
+            done[idx] = 1
+
+
+def _load_lang_state(
+    source_path,
+    out_dir_path,
+    base_name,
+    lang_code,
+    total,
+    model,
+    base_url,
+    resume,
+    force_restart,
+):
+    lang_name = DEFAULT_LANGS[lang_code]
+    progress_path = _progress_path(out_dir_path, base_name, lang_code)
+    log_path = _progress_log_path(progress_path)
+    snapshot_paths = _progress_snapshot_paths(progress_path)
+    if force_restart:
+        for path in snapshot_paths:
+            path.unlink(missing_ok=True)
+        log_path.unlink(missing_ok=True)
+
+    done = bytearray(total)
+    cache = {}
+    out_texts = [None] * total
+    existing = next((path for path in snapshot_paths if path.exists()), None)
+    if resume and existing is not None:
+        state = _load_progress_state(existing)
+        done, cache, out_texts = _validate_progress_state(
+            state=state,
+            source_path=source_path,
+            total=total,
+            model=model,
+            base_url=base_url,
+            lang_code=lang_code,
+            progress_path=existing,
+        )
+        _replay_progress_log(log_path, cache)
+        print(
+            f"Resuming {lang_name} ({lang_code}): "
+            f"{done.count(1)}/{total} already done, "
+            f"{len(cache)} cached translations"
+        )
+    return {
+        "progress_path": progress_path,
+        # Snapshots under the other name, removed once a new one is written.
+        "stale_paths": [path for path in snapshot_paths if path != progress_path],
+        "log_path": log_path,
+        "log": None,
+        "out_path": out_dir_path / f"{base_name}_{lang_code}.json",
+        "done": done,
+        "cache": cache,
+        "out_texts": out_texts,
+    }
+
+
+async def _translate_languages(
+    data,
+    instructions,
+    source_path,
+    out_dir_path,
+    base_name,
+    lang_codes,
+    model,
+    base_url,
+    api_key,
+    batch_size,
+    timeout,
+    max_retries,
+    resume,
+    force_restart,
+    concurrency,
+    max_batch_size,
+    max_batch_chars,
+    shared_cache,
+):
+    total = len(data)
+    states = {
+        lang_code: _load_lang_state(
+            source_path=source_path,
+            out_dir_path=out_dir_path,
+            base_name=base_name,
+            lang_code=lang_code,
+            total=total,
+            model=model,
+            base_url=base_url,
+            resume=resume,
+            force_restart=force_restart,
+        )
+        for lang_code in lang_codes
+    }
+
+    def compact_progress():
+        # Rewrite each snapshot, then truncate its log. A crash in between
+        # only replays entries the snapshot already holds.
+        for lang_code, state in states.items():
+            _atomic_write_progress(
+                state["progress_path"],
+                _build_progress_state(
+                    source_path=source_path,
+                    total=total,
+                    model=model,
+                    base_url=base_url,
+                    lang_code=lang_code,
+                    done=state["done"],
+                    cache=state["cache"],
+                    out_texts=state["out_texts"],
+                ),
+            )
+            for path in state["stale_paths"]:
+                path.unlink(missing_ok=True)
+            state["stale_paths"] = []
+            if state["log"] is None:
+                state["log"] = state["log_path"].open("wb")
+            else:
+                state["log"].seek(0)
+                state["log"].truncate()
+
+    def close_logs():
+        for state in states.values():
+            if state["log"] is not None:
+                state["log"].close()
+                state["log"] = None
+
+    def report():
+        done = ", ".join(
+            f"{lang_code} {state['done'].count(1)}/{total}"
+            for lang_code, state in states.items()
+        )
+        print(f"  {done} done")
+
+    try:
+        # Translate each distinct instruction once per language, then fan the
+        # result out to every position that uses it.
+        positions_by_instruction = {}
+        for idx, instruction in enumerate(instructions):
+            positions_by_instruction.setdefault(instruction, []).append(idx)
+
+        passthrough = [s for s in positions_by_instruction if _is_passthrough(s)]
+        pending = {}
+        reused = 0
+        for lang_code, state in states.items():
+            cache = state["cache"]
+            for instruction in passthrough:
+                cache.setdefault(instruction, instruction)
+            # A forced restart retranslates everything; fresh results still
+            # overwrite the shared cache rows.
+            if shared_cache is not None and not force_restart:
+                found = _lookup_translations(
+                    shared_cache,
+                    model,
+                    lang_code,
+                    [s for s in positions_by_instruction if s not in cache],
+                )
+                cache.update(found)
+                reused += len(found)
+            cached = [s for s in positions_by_instruction if s in cache]
+            _apply_cached(cached, positions_by_instruction, state)
+            for instruction in positions_by_instruction:
+                if instruction not in cache:
+                    pending.setdefault(instruction, []).append(lang_code)
+        pending_instructions = list(pending)
+        await asyncio.to_thread(compact_progress)
+
+        names = ", ".join(f"{DEFAULT_LANGS[code]} ({code})" for code in lang_codes)
+        print(
+            f"Translating to {names}: {len(pending_instructions)} unique instructions "
+            f"pending across {total} items "
+            f"({reused} translations reused from {TRANSLATION_CACHE_NAME})..."
+        )
+        # Each batch is one request covering every language that still needs
+        # any of its instructions. Keep up to `concurrency` requests in flight;
+        # results are applied by this coroutine only, so the per-language
+        # state needs no lock.
+        #
+        # Batch size adapts: it doubles (up to max_batch_size) after a fast
+        # reply, and a batch the model could not handle is split in half and
+        # requeued. max_batch_chars caps instruction characters times the
+        # number of languages requested, since the reply repeats every
+        # instruction once per language.
+        current_size = batch_size
+        cursor = 0
+        requeued = deque()
+        inflight = {}
+        completed = 0
+        failure = None
+        while True:
+            while failure is None and len(inflight) < concurrency:
+                if requeued:
+                    to_translate = requeued.popleft()
+                elif cursor < len(pending_instructions):
+                    # When what is left would not fill the idle slots, spread
+                    # it over them (down to MIN_PARALLEL_CHUNK per request)
+                    # instead of queueing it behind one large batch.
+                    remaining = len(pending_instructions) - cursor
+                    idle = concurrency - len(inflight)
+                    size = min(
+                        current_size, max(MIN_PARALLEL_CHUNK, -(-remaining // idle))
+                    )
+                    end = cursor + min(size, remaining)
+                    if max_batch_chars is not None:
+                        first = pending_instructions[cursor]
+                        chars = len(first)
+                        codes = set(pending[first])
+                        stop = cursor + 1
+                        while stop < end:
+                            instruction = pending_instructions[stop]
+                            grown = codes.union(pending[instruction])
+                            if (chars + len(instruction)) * len(grown) > max_batch_chars:
+                                break
+                            chars += len(instruction)
+                            codes = grown
+                            stop += 1
+                        end = stop
+                    to_translate = pending_instructions[cursor:end]
+                    cursor = end
+                else:
+                    break
+                request_codes = [
+                    code
+                    for code in lang_codes
+                    if any(code in pending[s] for s in to_translate)
+                ]
+                future = asyncio.create_task(
+                    call_api_multilang_batch(
+                        to_translate,
+                        request_codes,
+                        model=model,
+                        base_url=base_url,
+                        api_key=api_key,
+                        timeout=timeout,
+                        max_retries=max_retries,
+                    )
+                )
+                inflight[future] = (to_translate, time.monotonic())
+
+            if not inflight:
+                break
+            finished, _ = await asyncio.wait(
+                inflight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in finished:
+                to_translate, started = inflight.pop(future)
+                try:
+                    by_lang = future.result()
+                except BatchTooLargeError as exc:
+                    if len(to_translate) == 1:
+                        if failure is None:
+                            failure = exc
+                        continue
+                    half = len(to_translate) // 2
+                    current_size = max(1, half)
+                    requeued.append(to_translate[:half])
+                    requeued.append(to_translate[half:])
+                    print(f"  batch of {len(to_translate)} too large; retrying halves")
+                    continue
+                except Exception as exc:
+                    # Stop submitting; requests already in flight still finish
+                    # and are recorded before the error is raised.
+                    if failure is None:
+                        failure = exc
+                    continue
+                for lang_code, translations in by_lang.items():
+                    state = states[lang_code]
+                    state["cache"].update(zip(to_translate, translations))
+                    if shared_cache is not None:
+                        _store_translations(
+                            shared_cache, model, lang_code, to_translate, translations
+                        )
+                    _apply_cached(to_translate, positions_by_instruction, state)
+                    log = state["log"]
+                    for instruction, translated in zip(to_translate, translations):
+                        entry = {"s": instruction, "t": translated}
+                        log.write(_json_dumps(entry) + b"\n")
+                    log.flush()
+                if time.monotonic() - started < ADAPTIVE_FAST_SECONDS:
+                    current_size = min(max_batch_size, current_size * 2)
+                completed += 1
+                if completed % PROGRESS_COMPACT_EVERY == 0:
+                    await asyncio.to_thread(compact_progress)
+                report()
+
+        if failure is not None:
+            await asyncio.to_thread(compact_progress)
+            raise failure
+    finally:
+        close_logs()
+
+    for lang_code, state in states.items():
+        done_count = state["done"].count(1)
+        out_texts = state["out_texts"]
+        if done_count != total or any(text is None for text in out_texts):
+            raise RuntimeError(
+                f"Incomplete translation for {lang_code}: {done_count}/{total} done."
+            )
+
+        out_path = state["out_path"]
+        # Output items are only materialized here, one language at a time.
+        out_items = [
+            {**item, "instruction": text} for item, text in zip(data, out_texts)
+        ]
+        out_path.write_bytes(_json_dumps(out_items, indent=True))
+        del out_items
+        state["progress_path"].unlink(missing_ok=True)
+        state["log_path"].unlink(missing_ok=True)
+        print(f"Wrote {out_path}")
 
 
 def translate_dataset(
@@ -206,12 +913,25 @@ def translate_dataset(
     api_key,
     batch_size,
     timeout=60,
-    max_retries=6,
+    max_retries=8,
     resume=True,
     force_restart=False,
+    concurrency=1,
+    max_batch_size=None,
+    max_batch_chars=None,
+    shared_cache=True,
 ):
-    data = json.loads(Path(data_path).read_text(encoding="utf-8"))
-    base_name = Path(data_path).stem
+    # Resolve the source once; every progress snapshot records it.
+    data_file = Path(data_path)
+    source_path = str(data_file.resolve())
+    data = _json_loads(data_file.read_bytes())
+    # Only the instruction field drives translation; the other fields are
+    # copied through when output items are built. A null instruction is
+    # treated as empty, which passes through untranslated.
+    instructions = [
+        "" if (s := item.get("instruction")) is None else s for item in data
+    ]
+    base_name = data_file.stem
     out_dir_path = Path(out_dir)
     out_dir_path.mkdir(parents=True, exist_ok=True)
     if batch_size <= 0:
@@ -220,102 +940,42 @@ def translate_dataset(
         raise ValueError("timeout must be a positive integer.")
     if max_retries <= 0:
         raise ValueError("max_retries must be a positive integer.")
+    if concurrency <= 0:
+        raise ValueError("concurrency must be a positive integer.")
+    max_batch_size = max(batch_size, max_batch_size or 0)
+    if max_batch_chars is not None and max_batch_chars <= 0:
+        raise ValueError("max_batch_chars must be a positive integer.")
 
-    for lang_code in langs:
-        lang_name = DEFAULT_LANGS[lang_code]
-        total = len(data)
-        out_path = out_dir_path / f"{base_name}_{lang_code}.json"
-        progress_path = _progress_path(out_dir_path, base_name, lang_code)
-
-        if force_restart and progress_path.exists():
-            progress_path.unlink()
-
-        done_indices = set()
-        cache = {}
-        out_items = [None] * total
-        if resume and progress_path.exists():
-            state = _load_progress_state(progress_path)
-            done_indices, cache, out_items = _validate_progress_state(
-                state=state,
-                data_path=data_path,
-                total=total,
+    cache_conn = open_translation_cache(out_dir_path) if shared_cache else None
+
+    async def run():
+        async with open_client(max_connections=concurrency):
+            await _translate_languages(
+                data=data,
+                instructions=instructions,
+                source_path=source_path,
+                out_dir_path=out_dir_path,
+                base_name=base_name,
+                lang_codes=langs,
                 model=model,
                 base_url=base_url,
-                lang_code=lang_code,
-                progress_path=progress_path,
-            )
-            print(
-                f"Resuming {lang_name} ({lang_code}): "
-                f"{len(done_indices)}/{total} already done"
+                api_key=api_key,
+                batch_size=batch_size,
+                timeout=timeout,
+                max_retries=max_retries,
+                resume=resume,
+                force_restart=force_restart,
+                concurrency=concurrency,
+                max_batch_size=max_batch_size,
+                max_batch_chars=max_batch_chars,
+                shared_cache=cache_conn,
             )
 
-        print(f"Translating to {lang_name} ({lang_code})...")
-        for start in range(0, total, batch_size):
-            batch_positions = list(range(start, min(start + batch_size, total)))
-            pending_positions = [idx for idx in batch_positions if idx not in done_indices]
-            if not pending_positions:
-                print(f"  {len(done_indices)}/{total} done")
-                continue
-
-            batch_items = [data[idx] for idx in pending_positions]
-            batch_instructions = [item.get("instruction", "") for item in batch_items]
-            translations = []
-            missing_indices = []
-            for i, instruction in enumerate(batch_instructions):
-                if instruction in cache:
-                    translations.append(cache[instruction])
-                else:
-                    translations.append(None)
-                    missing_indices.append(i)
-
-            if missing_indices:
-                to_translate = [batch_instructions[i] for i in missing_indices]
-                batch_translations = call_api_batch(
-                    to_translate,
-                    lang_name,
-                    model=model,
-                    base_url=base_url,
-                    api_key=api_key,
-                    timeout=timeout,
-                    max_retries=max_retries,
-                )
-                for i, translated in zip(missing_indices, batch_translations):
-                    translations[i] = translated
-                    cache[batch_instructions[i]] = translated
-
-            for idx, item, translated in zip(pending_positions, batch_items, translations):
-                new_item = dict(item)
-                new_item["instruction"] = translated
-                out_items[idx] = new_item
-                done_indices.add(idx)
-
-            _atomic_write_json(
-                progress_path,
-                _build_progress_state(
-                    data_path=data_path,
-                    total=total,
-                    model=model,
-                    base_url=base_url,
-                    lang_code=lang_code,
-                    done_indices=done_indices,
-                    cache=cache,
-                    out_items=out_items,
-                ),
-            )
-            print(f"  {len(done_indices)}/{total} done")
-
-        if len(done_indices) != total or any(item is None for item in out_items):
-            raise RuntimeError(
-                f"Incomplete translation for {lang_code}: {len(done_indices)}/{total} done."
-            )
-
-        out_path.write_text(
-            json.dumps(out_items, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
-        if progress_path.exists():
-            progress_path.unlink()
-        print(f"Wrote {out_path}")
+    try:
+        asyncio.run(run())
+    finally:
+        if cache_conn is not None:
+            cache_conn.close()
 
 
 def parse_args():
@@ -351,7 +1011,22 @@ def parse_args():
         "--batch-size",
         type=int,
         default=10,
-        help="Number of instructions per API request (default: 10)",
+        help="Initial number of instructions per API request (default: 10)",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=40,
+        help="Upper bound when growing the batch size after fast replies (default: 40)",
+    )
+    parser.add_argument(
+        "--max-batch-chars",
+        type=int,
+        default=20000,
+        help=(
+            "Max instruction characters per API request, multiplied by the "
+            "number of languages it asks for (default: 20000)"
+        ),
     )
     parser.add_argument(
         "--timeout",
@@ -362,8 +1037,26 @@ def parse_args():
     parser.add_argument(
         "--max-retries",
         type=int,
-        default=6,
-        help="Max retries for each API request (default: 6)",
+        default=8,
+        help="Max retries for each API request (default: 8)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of batch requests in flight at once (default: 8)",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=None,
+        help="Client-side cap on requests per minute (default: unlimited)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=None,
+        help="Client-side cap on estimated tokens per minute (default: unlimited)",
     )
     parser.add_argument(
         "--resume",
@@ -381,7 +1074,20 @@ def parse_args():
     parser.add_argument(
         "--force-restart",
         action="store_true",
-        help="Delete existing progress file for each language before translation",
+        help=(
+            "Delete existing progress file for each language before translation "
+            "and ignore (but refresh) the shared translation cache"
+        ),
+    )
+    parser.add_argument(
+        "--no-shared-cache",
+        dest="shared_cache",
+        action="store_false",
+        help=(
+            "Do not read or write the cross-run translation cache "
+            f"({TRANSLATION_CACHE_NAME} in --out-dir); --force-restart "
+            "already skips reading it"
+        ),
     )
     return parser.parse_args()
 
@@ -400,6 +1106,8 @@ def main():
     if unknown:
         raise SystemExit(f"Unsupported language code(s): {', '.join(unknown)}")
 
+    configure_rate_limit(rpm=args.rpm, tpm=args.tpm)
+
     translate_dataset(
         data_path=args.data,
         out_dir=out_dir,
@@ -412,6 +1120,10 @@ def main():
         max_retries=args.max_retries,
         resume=args.resume,
         force_restart=args.force_restart,
+        concurrency=args.concurrency,
+        max_batch_size=args.max_batch_size,
+        max_batch_chars=args.max_batch_chars,
+        shared_cache=args.shared_cache,
     )
 
 